@@ -1,61 +1,270 @@
-import argparse, heapq
+import argparse, heapq, mmap
 import time
 from pathlib import Path
-from collections import Counter
-from hurry.filesize import size
+import numpy as np
 from tabulate import tabulate
 
+try:
+	from numba import njit
+except ImportError:  # numba is optional, without it the jitted functions run as plain python
+	def njit(*args, **kwargs):
+		def decorator(function):
+			# over memoryviews of the array arguments, indexing them gives python ints instead of numpy scalars
+			def wrapper(*arguments):
+				return function(*(memoryview(a) if isinstance(a, np.ndarray) else a for a in arguments))
+			return wrapper
+		return decorator
+
+
+@njit(cache=True)
+def _split_stream(data, byte_size, out):
+	# split data msb first into byte_size-bit symbols, the last one right-padded with 0s, returns the number written
+	written = 0
+	acc = 0
+	nbits = 0
+	mask = (1 << byte_size) - 1
+	for i in range(data.shape[0]):
+		# load a byte into the accumulator, then take every full symbol off its top
+		acc = (acc << 8) | int(data[i])
+		nbits += 8
+		while nbits >= byte_size:
+			nbits -= byte_size
+			out[written] = (acc >> nbits) & mask
+			written += 1
+		acc &= (1 << nbits) - 1
+	if nbits:  # split_padding 0s
+		out[written] = acc << (byte_size - nbits)
+		written += 1
+	return written
+
+
+@njit(cache=True)
+def _encode_stream(symbols, code_bits, code_lens, out, acc, nbits):
+	# pack the code of every symbol msb first into out, same as BitWriter.write() in a loop
+	written = 0
+	for i in range(symbols.shape[0]):
+		symbol = int(symbols[i])
+		length = int(code_lens[symbol])
+		acc = (acc << length) | int(code_bits[symbol])
+		nbits += length
+		while nbits >= 8:
+			nbits -= 8
+			out[written] = (acc >> nbits) & 0xFF
+			written += 1
+		acc &= (1 << nbits) - 1
+	# return the number of bytes written and the bits left in the accumulator
+	return written, acc, nbits
+
+
+@njit(cache=True)
+def _decode_stream(
+	data, position, end, max_length, fast_bits, fast, limit, first_code, first_index, symbols,
+	byte_size, out, out_acc, out_nbits
+):
+	# decode the bits [position, end) of data msb first, packing every symbol into out as byte_size bits, until either
+	# runs out, returns the number of bytes written, the position decoding stopped at and the bits left in out_acc
+	written = 0
+	acc = 0
+	nbits = -(position & 7)  # the bits of the first byte before position get loaded, then masked off
+	index = position >> 3
+	while position < end and written + 2 <= out.shape[0]:  # a symbol fills at most 2 bytes
+		# refill the accumulator to at least max_length bits, 0s past the end of data
+		while nbits < max_length:
+			acc = (acc << 8) | (int(data[index]) if index < data.shape[0] else 0)
+			index += 1
+			nbits += 8
+		acc &= (1 << nbits) - 1
+
+		# peek the next max_length bits, codes of up to fast_bits bits are a single fast table lookup
+		window = acc >> (nbits - max_length)
+		entry = int(fast[window >> (max_length - fast_bits)])
+		if entry >= 0:  # entry: (symbol << 4) | length
+			symbol = entry >> 4
+			length = entry & 0xF
+		else:  # longer code, the code length is the first one whose limit is above the window
+			length = fast_bits + 1
+			while window >= limit[length]:
+				length += 1
+			symbol = symbols[first_index[length] + (window >> (max_length - length)) - first_code[length]]
+
+		nbits -= length
+		position += length
+
+		# same as BitWriter.write(symbol, byte_size)
+		out_acc = (out_acc << byte_size) | symbol
+		out_nbits += byte_size
+		while out_nbits >= 8:
+			out_nbits -= 8
+			out[written] = (out_acc >> out_nbits) & 0xFF
+			written += 1
+		out_acc &= (1 << out_nbits) - 1
+	return written, position, out_acc, out_nbits
+
+
+@njit(cache=True)
+def _minimum_redundancy(weights):
+	# moffat and katajainen's in-place code lengths: weights (at least 2, ascending) are overwritten with the optimal
+	# code length of each, longest first [1, 1, 2, 4] -> [3, 3, 2, 1]
+	n = weights.shape[0]
+
+	# phase 1, build the tree left to right: merged weights, then parent pointers of the merged nodes
+	weights[0] += weights[1]
+	root, leaf = 0, 2
+	for next in range(1, n - 1):
+		# first child, the smaller of the next merged node and the next leaf
+		if leaf >= n or weights[root] < weights[leaf]:
+			weights[next] = weights[root]
+			weights[root] = next
+			root += 1
+		else:
+			weights[next] = weights[leaf]
+			leaf += 1
+		# second child
+		if leaf >= n or (root < next and weights[root] < weights[leaf]):
+			weights[next] += weights[root]
+			weights[root] = next
+			root += 1
+		else:
+			weights[next] += weights[leaf]
+			leaf += 1
+
+	# phase 2, parent pointers to depths of the merged nodes, right to left from the root
+	weights[n - 2] = 0
+	for next in range(n - 3, -1, -1):
+		weights[next] = weights[weights[next]] + 1
+
+	# phase 3, depths of the merged nodes to depths of the leaves, level by level
+	available, used, depth = 1, 0, 0
+	root, next = n - 2, n - 1
+	while available > 0:
+		while root >= 0 and weights[root] == depth:  # nodes at this depth that are merged, not leaves
+			used += 1
+			root -= 1
+		while available > used:  # the rest are leaves
+			weights[next] = depth
+			next -= 1
+			available -= 1
+		available, used, depth = 2 * used, 0, depth + 1
+
+
+def _size(n):
+	# size rounded down to a whole B, K, M, G, T or P (powers of 1024)
+	for unit in 'BKMGT':
+		if n < 1024:
+			break
+		n //= 1024
+	else:
+		unit = 'P'
+	return f'{n}{unit}'
+
 
 class Huffman:
 	# our chosen file extension
 	encoded_file_extension = '.huff'
-
-	class Node:
-		def __init__(self, char, freq, code):
-			self.char = char
-			self.freq = freq
-			self.code = code
-			self.left = None
-			self.right = None
-
-		# For comparison of nodes
-		def __lt__(self, other):
-			# for priority queue, based on frequency
-			return self.freq < other.freq
-
-		def __repr__(self):
-			# debug if self.print:printing
-			return f'Node({self.char}: {self.freq}, {self.code})'
+	fast_bits = 9  # codes up to this long are decoded with a single table lookup
+	chunk_size = 1 << 20  # source bytes split and encoded, or destination bytes decoded, at a time
+	max_code_length = 15  # longer codes get limited, unless there are too many symbols to fit
+
+	class BitWriter:
+		def __init__(self, file):
+			self.file = file  # full bytes get written out to it on flush()
+			self.buffer = bytearray()
+			self.acc = 0  # bits not yet flushed into buffer, msb first
+			self.nbits = 0
+
+		def write(self, bits, length):
+			# append length bits to the accumulator, then flush every full byte off its top
+			self.acc = (self.acc << length) | bits
+			self.nbits += length
+			while self.nbits >= 8:
+				self.nbits -= 8
+				self.buffer.append(self.acc >> self.nbits)
+				self.acc &= (1 << self.nbits) - 1
+
+		def write_symbols(self, symbols, code_bits, code_lens, total_bits):
+			# write() the code of every symbol in bulk, total_bits being the sum of their lengths
+			out = np.empty((self.nbits + total_bits) // 8, dtype=np.uint8)
+			written, self.acc, self.nbits = _encode_stream(symbols, code_bits, code_lens, out, self.acc, self.nbits)
+			self.buffer += memoryview(out)[:written]
+
+		def flush(self):
+			# write the full bytes out to file, only the last partial byte stays in the accumulator
+			self.file.write(self.buffer)
+			self.buffer.clear()
+
+		def finish(self):
+			# right-pad the last partial byte with 0s, flush it, return the number of padding bits
+			padding = (8 - self.nbits) % 8
+			self.write(0, padding)
+			self.flush()
+			return padding
+
+	class BitReader:
+		def __init__(self, data):
+			self.data = data  # uint8 array
+			self.index = 0  # next byte to load into the accumulator
+			self.acc = 0  # loaded bits not yet read, msb first
+			self.nbits = 0
+
+		@property
+		def position(self):
+			# next bit to read
+			return self.index * 8 - self.nbits
+
+		def peek_bits(self, length):
+			# the next length bits as an integer, without reading them, 0s past the end of data
+			while self.nbits < length:
+				self.acc = (self.acc << 8) | (int(self.data[self.index]) if self.index < self.data.size else 0)
+				self.index += 1
+				self.nbits += 8
+			return self.acc >> (self.nbits - length)
+
+		def read_bits(self, length):
+			# read length bits msb first, dropping them off the top of the accumulator
+			value = self.peek_bits(length)
+			self.nbits -= length
+			self.acc &= (1 << self.nbits) - 1
+			return value
 
 	@staticmethod
-	def flatten_tree(node, heap=None):
-		# convert the tree into a list of nodes (post-order traversal)
-		if heap is None:
-			heap = []
-		if node:
-			if node.left:
-				Huffman.flatten_tree(node.left, heap)
-			if node.right:
-				Huffman.flatten_tree(node.right, heap)
-			heap.append(node)
-		return heap
+	def canonical_codes(lengths):
+		# assign canonical codes from {char: length}, in (length, char) order every code is the previous one + 1,
+		# shifted left whenever the length grows {a: 1, b: 2, c: 2} -> {a: (0b0, 1), b: (0b10, 2), c: (0b11, 2)}
+		code_dict = {}
+		bits, previous_length = 0, 0
+		for char, length in sorted(lengths.items(), key=lambda x: (x[1], x[0])):
+			# a lone symbol (the tree is a single leaf) still needs 1 bit
+			length = max(length, 1)
+			bits <<= length - previous_length
+			code_dict[char] = (bits, length)
+			bits += 1
+			previous_length = length
+		return code_dict
 
 	@staticmethod
-	def encode_tree(node, code=None):
-		# Encode the tree structure as a string (recursive)
-		if code is None:
-			code = ''
-
-		if node:  # if we have a node
-			if node.char:  # if we're a leaf node, we append 1 and node.char to the code
-				code += '1' + node.char
-			else:  # else we're not a leaf but have 2 child nodes, append 0, go left, then right
-				left, right = node.left, node.right
-				code += '0'
-				code = Huffman.encode_tree(left, code)
-				code = Huffman.encode_tree(right, code)
-
-		return code
+	def package_merge(weights, longest):
+		# optimal code lengths of at most longest bits for weights (ascending): every level, from the deepest up,
+		# is the leaves merged with the previous level paired up into packages, sorted by weight
+		# a leaf's code length is the number of times it's among the first 2n - 2 items of the top level, counting
+		# the leaves inside the packages taken, a package taken on one level takes its pair off the previous one
+		leaves = [(weight, char, None) for char, weight in enumerate(weights)]
+		levels = [leaves]
+		for _ in range(longest - 1):
+			previous = levels[-1]
+			packages = [(previous[i][0] + previous[i + 1][0], None, i) for i in range(0, len(previous) - 1, 2)]
+			levels.append(list(heapq.merge(leaves, packages, key=lambda item: item[0])))
+
+		lengths = [0] * len(weights)
+		taken = 2 * len(weights) - 2
+		for level in reversed(levels):
+			packages = 0
+			for _, char, pair in level[:taken]:
+				if pair is None:
+					lengths[char] += 1
+				else:
+					packages += 1
+			taken = 2 * packages
+		return lengths
 
 	def __init__(self):
 		self.parser = None
@@ -71,10 +280,11 @@ class Huffman:
 		self.source_index = 0
 		self.source_length = 0
 
-		self.destination_data = None
-
-		self.huffman_tree = None
+		self.huffman_lengths = None
 		self.huffman_table = None
+		self.huffman_frequencies = None
+		self.code_bits = None
+		self.code_lens = None
 
 		self.print = None
 
@@ -137,229 +347,247 @@ class Huffman:
 		if self.print:
 			print(f'{self.source, self.destination = }')
 
-		# get bytes as bit string
+		# get raw file bytes
 		self.source_data = self._read_source_bytes()
 		if self.print:
-			print(f'{self.source_data = }')
+			print(f'{self.source_data.size = }')
 
-		# split bytes by byte_size (adds split_padding)
-		self.source_data = self._split_bytes()
+		# calculate right-padding to be able to split file bytes into byte_size bytes
+		self.split_padding = -self.source_data.size * 8 % self.byte_size
 		if self.print:
-			print(f'{self.source_data = }')
+			print(f'{self.split_padding = }')
 
-		# generate huffman_tree and huffman_table
-		self._generate_codes(self._build_huffman_tree())
+		# generate huffman_lengths and huffman_table, the first pass over the symbols
+		self._generate_codes(self._huffman_lengths())
 		if self.print:
-			print(f'{self.huffman_table = }')
-			print(f'{self.huffman_tree = }')
+			print(f'{len(self.huffman_table) = }')
 
-		# encode using huffman_table
-		self.destination_data = [self.huffman_table[byte] for byte in self.source_data]
+		# data length, every symbol's frequency times its code length
+		data_bits = int(np.dot(self.huffman_frequencies, self.code_lens))
 		if self.print:
-			print(f'{self.destination_data = }')
-
-		# !!! Add header to d_bytes start before writing to file
-		# byte_size: 4 bits, encoding: -1, decoding: +1
+			print(f'{data_bits = }')
 
-		# Add header information before writing to file
-		bin_byte_size = bin(self.byte_size - 1)[2:].zfill(4)
-		if self.print:
-			print(f'{bin_byte_size = }')
-		# split_padding: 4 bits
-		bin_split_padding = bin(self.split_padding)[2:].zfill(4)
-		if self.print:
-			print(f'{bin_split_padding = }')
-		# huffman_table
-		bin_huffman_table = self._compress_huffman_table()
+		# huffman_table, as (bits, length) fields of its code lengths
+		table_fields = self._compress_huffman_table()
+		table_bits = sum(length for _, length in table_fields)
 		if self.print:
-			print(f'{bin_huffman_table = }')
+			print(f'{table_bits = }')
 
-		# byte_size (4bits) + split_padding (4bits) + normal_padding (4bits) (inserted in _normalize_bytes) + compressed huffman_table
-		self.destination_data.insert(0, bin_byte_size + bin_split_padding + '' + bin_huffman_table)
+		# normal_padding: right-padding needed to fit header (12bits) + huffman_table + data into 8-bit bytes
+		self.normal_padding = -(12 + table_bits + data_bits) % 8
 		if self.print:
-			print(f'{self.destination_data = }')
-
-		# normalizes d_bytes into 8-bit bytes, adds normal_padding, encodes split and normal padding into header
-		self.destination_data = self._normalize_bytes(self.destination_data, True)
-		if self.print:
-			print(f'{self.destination_data = }')
+			print(f'{self.normal_padding = }')
 
-		# writing to file
+		# writing to file as we go
 		with open(self.destination, 'wb') as f:
-			f.write(bytearray(self.destination_data))
+			# byte_size (4bits, encoding: -1, decoding: +1) + split_padding (4bits) + normal_padding (4bits)
+			writer = Huffman.BitWriter(f)
+			writer.write(self.byte_size - 1, 4)
+			writer.write(self.split_padding, 4)
+			writer.write(self.normal_padding, 4)
+			# + compressed huffman_table
+			for bits, length in table_fields:
+				writer.write(bits, length)
+			# + data, encoded using huffman_table a chunk at a time, the second pass over the symbols
+			for symbols in self._split_bytes():
+				chunk_bits = int(self.code_lens[symbols].sum(dtype=np.int64))
+				writer.write_symbols(symbols, self.code_bits, self.code_lens, chunk_bits)
+				writer.flush()
+
+			# flush the last 8-bit byte, right-padded with normal_padding 0s
+			writer.finish()
 
 	def _decode(self):
 		if self.print:
 			print(f'{self.source, self.destination = }')
 
-		# get bytes as bit string
+		# get raw file bytes, read as a bitstream
 		self.source_data = self._read_source_bytes()
-		self.source_index = 0
-		self.source_length = len(self.source_data)
+		self.source_length = self.source_data.size * 8
+		reader = Huffman.BitReader(self.source_data)
 		if self.print:
-			print(f'{self.source_data = }')
+			print(f'{self.source_data.size = }')
 
 		# byte_size: first 4 bits, encoding: -1, decoding: +1
-		self.byte_size = int(self.source_data[:4], 2) + 1
+		self.byte_size = reader.read_bits(4) + 1
 		if self.print:
 			print(f'{self.byte_size = }')
 
 		# split_padding: next 4 bits
-		self.split_padding = int(self.source_data[4:8], 2)
+		self.split_padding = reader.read_bits(4)
 		if self.print:
 			print(f'{self.split_padding = }')
 
 		# normal_padding: next 4 bits
-		self.normal_padding = int(self.source_data[8:12], 2)
+		self.normal_padding = reader.read_bits(4)
 		if self.print:
 			print(f'{self.normal_padding = }')
 
-		# setup empty root node
-		self.huffman_tree = Huffman.Node(None, None, '')
-		# get remaining s_bytes after decompressing huffman table bits into huffman_tree
-		self.source_index = 12
-		self._uncompress_huffman_tree(self.huffman_tree)
+		# data starts after the code lengths, rebuild the canonical codes from them
+		self.huffman_table = Huffman.canonical_codes(self._uncompress_huffman_table(reader))
+		self.source_index = reader.position
 		if self.print:
-			print(f'{self.source_data[self.source_index:] = }')
-			print(f'{self.huffman_tree = }')
-
-		# read huffman_table (in reverse code: char) from flattened huffman_tree, where nodes are leaves
-		self.huffman_table = {node.code: node.char for node in Huffman.flatten_tree(self.huffman_tree) if node.char}
+			print(f'{self.source_index = }')
+			print(f'{len(self.huffman_table) = }')
+
+		# canonical decoding tables (Moffat-Turpin), indexed by code length
+		# symbols: chars sorted by (length, char), the order their codes were assigned in
+		symbols = sorted(self.huffman_table, key=lambda char: (self.huffman_table[char][1], char))
+		max_length = self.huffman_table[symbols[-1]][1]
+		count = [0] * (max_length + 1)  # number of codes with that length
+		for _, length in self.huffman_table.values():
+			count[length] += 1
+		first_code = np.zeros(max_length + 1, dtype=np.int64)  # code of the first symbol with that length
+		first_index = np.zeros(max_length + 1, dtype=np.int64)  # index in symbols of the first symbol with that length
+		limit = np.zeros(max_length + 1, dtype=np.int64)  # max_length-bit windows below limit hold a code that long or shorter
+		bits, index = 0, 0
+		for length in range(1, max_length + 1):
+			first_code[length], first_index[length] = bits, index
+			bits, index = bits + count[length], index + count[length]
+			limit[length] = bits << (max_length - length)
+			bits <<= 1
 		if self.print:
-			print(f'{self.huffman_table = }')
+			print(f'{first_code, first_index, limit = }')
+
+		# fast table indexed by the next fast_bits bits, (symbol << 4) | length for codes that fit, else -1
+		fast_bits = min(Huffman.fast_bits, max_length)
+		fast = np.full(1 << fast_bits, -1, dtype=np.int32)
+		for char, (bits, length) in self.huffman_table.items():
+			if length <= fast_bits:  # every index starting with the code's bits
+				shift = fast_bits - length
+				fast[bits << shift:(bits + 1) << shift] = (char << 4) | length
+		if self.print:
+			print(f'{fast_bits, int(np.count_nonzero(fast >= 0)) = }')
 
-		self.destination_data = []
 		# fixing normal_padding (added in encoding at the end to fit 8-bit bytes) 10101010 1111[0000]
 		self.source_length -= self.normal_padding
-		# s_bytes = s_bytes[:len(s_bytes) - self.normal_padding]
 		if self.print:
-			print(f'{self.source_data[self.source_index:self.source_length] = }')
-
-		# decoding using huffman_table
-		current_byte = ''
-		while self.source_index < self.source_length:  # S[10010]1010101010101, [10010]S[10101]0101010101
-			current_byte += self.source_data[self.source_index]
-			self.source_index += 1
-			if current_byte in self.huffman_table:
-				self.destination_data.append(self.huffman_table[current_byte])
-				current_byte = ''
+			print(f'{self.source_length = }')
 
-		if self.print:
-			print(f'{self.destination_data = }')
-
-		# fixing split_padding (added in encoding at the start, when splitting source bytes into byte_size)
-		# 11000 -> 11
-		self.destination_data[-1] = self.destination_data[-1][:len(self.destination_data[-1]) - self.split_padding]
-		if self.print:
-			print(f'{self.destination_data = }')
+		# the decoded symbols are written back as byte_size bits each, straight into out
+		symbols = np.array(symbols, dtype=np.int64)
+		out = np.empty(Huffman.chunk_size, dtype=np.uint8)
 
-		# normalizing d_bytes into 8-bit bytes for writing
-		self.destination_data = self._normalize_bytes(self.destination_data)
-		if self.print:
-			print(f'{self.destination_data = }')
-
-		# writing to file
+		# writing to file as we go
 		with open(self.destination, 'wb') as f:
-			f.write(bytearray(self.destination_data))
-
-	def _read_source_bytes(self):
-		# split all file bytes by byte, get the binary string representation, remove '0b' start, pad left with 0s
-		return ''.join(bin(byte)[2:].zfill(8) for byte in self.source.read_bytes())
-
-	def _split_bytes(self) -> [str]:
-		# calculate right-padding to be able to split file_bytes into byte_size bytes
-		self.split_padding = ((self.byte_size - len(self.source_data) % self.byte_size) % self.byte_size)
-		self.source_data += '0' * self.split_padding
-		# return a list of bit strings split every byte_size
-		return [self.source_data[i:i + self.byte_size] for i in range(0, len(self.source_data), self.byte_size)]
-
-	def _build_huffman_tree(self):
-		# build frequency dict [1, 1, 2, 2, 3] -> {1: 2, 2: 2, 3: 1}
-		frequency = Counter(self.source_data)
-		# init heap [Node(1, 2, None), Node(2, 2, None), Node(3, 1, None)]
-		heap = [Huffman.Node(char, freq, None) for char, freq in frequency.items()]
-		# heapify based on Node.__lt__, which sorts by node.freq
-		heapq.heapify(heap)
-
-		# while we have more than 1 element
-		while len(heap) > 1:
-			# pop the 2 smallest (by freq) nodes
-			node1 = heapq.heappop(heap)
-			node2 = heapq.heappop(heap)
-
-			# create a parent node with summed freqs
-			merged = Huffman.Node(None, node1.freq + node2.freq, None)
-			merged.left = node1
-			merged.right = node2
-
-			# push parent
-			heapq.heappush(heap, merged)
-
-		# heap[0] is the root of the whole tree, save and return it
-		self.huffman_tree = heap[0]
-		return self.huffman_tree
-
-	def _generate_codes(self, node, prefix='', code_dict=None):
-		if code_dict is None:
-			code_dict = {}
-
-		if node:  # if we have a node
-			if node.char:  # if we're a leaf, assign prefix as the encoding of node.char
-				code_dict[node.char] = prefix
-			else:  # else we travel left (1), then right (0)
-				self._generate_codes(node.left, prefix + '1', code_dict)
-				self._generate_codes(node.right, prefix + '0', code_dict)
-
-		# save huffman_table and return it
-		self.huffman_table = code_dict
+			position = self.source_index
+			acc, nbits = 0, 0  # bits of the last partial byte of out, msb first
+			# decoding using the fast and canonical tables, a chunk of bytes at a time
+			while position < self.source_length:
+				written, position, acc, nbits = _decode_stream(
+					self.source_data, position, self.source_length, max_length, fast_bits, fast,
+					limit, first_code, first_index, symbols, self.byte_size, out, acc, nbits
+				)
+				# fixing split_padding (added in encoding at the end, when splitting source bytes into byte_size)
+				# 11000 -> 11, the source was whole bytes, so only padding is left in acc, plus a byte of it out
+				# already if there were at least 8 bits
+				if position >= self.source_length:
+					written -= (self.split_padding - nbits) // 8
+				f.write(memoryview(out)[:written])
+
+	def _read_source_bytes(self) -> np.ndarray:
+		# map the file and view its bytes as a uint8 array, pages are only read in as they're used
+		with open(self.source, 'rb') as f:
+			mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		# every pass reads it front to back, so the os can read ahead further (not every platform has madvise)
+		if hasattr(mapped, 'madvise'):
+			mapped.madvise(mmap.MADV_SEQUENTIAL)
+		return np.frombuffer(mapped, dtype=np.uint8)
+
+	def _split_bytes(self):
+		# chunks of a multiple of byte_size bytes split into whole symbols, only the last one needs padding
+		step = max(Huffman.chunk_size // self.byte_size, 1) * self.byte_size
+		for start in range(0, self.source_data.size, step):
+			chunk = self.source_data[start:start + step]
+
+			# 8-bit symbols are the file bytes themselves
+			if self.byte_size == 8:
+				yield chunk
+				continue
+
+			# integer symbols, each byte_size bits wide
+			symbols = np.empty((chunk.size * 8 + self.byte_size - 1) // self.byte_size, dtype=np.uint16)
+			_split_stream(chunk, self.byte_size, symbols)
+			yield symbols
+
+	def _huffman_lengths(self) -> {int: int}:
+		# build frequency array with a bucket per possible symbol [1, 1, 2, 2, 3] -> [0, 2, 2, 1, 0, ...]
+		self.huffman_frequencies = np.zeros(1 << self.byte_size, dtype=np.int64)
+		for symbols in self._split_bytes():
+			self.huffman_frequencies += np.bincount(symbols, minlength=1 << self.byte_size)
+
+		# used chars by ascending frequency (ties in char order), the order the code lengths get computed in
+		chars = np.flatnonzero(self.huffman_frequencies)
+		chars = chars[np.argsort(self.huffman_frequencies[chars], kind='stable')]
+		weights = self.huffman_frequencies[chars]
+
+		# no tree needed, the optimal code lengths are computed in place over the sorted frequencies
+		# a lone symbol gets length 0, canonical_codes() gives it 1 bit
+		longest = max(Huffman.max_code_length, (chars.size - 1).bit_length())
+		if chars.size == 1:
+			lengths = [0]
+		else:
+			lengths = weights.copy()
+			_minimum_redundancy(lengths)
+			lengths = lengths.tolist()
+			# too long for the fast decoding tables, recompute them limited
+			if lengths[0] > longest:
+				lengths = Huffman.package_merge(weights.tolist(), longest)
+		if self.print:
+			print(f'{longest, max(lengths) = }')
+
+		# save huffman_lengths (char: length) and return them
+		self.huffman_lengths = dict(zip(chars.tolist(), lengths))
+		return self.huffman_lengths
+
+	def _generate_codes(self, lengths):
+		# save canonical huffman_table (char: (bits, length))
+		self.huffman_table = Huffman.canonical_codes(lengths)
+
+		# and lay it out as arrays indexed by symbol, for the jitted encoder, then return it
+		self.code_bits = np.zeros(1 << self.byte_size, dtype=np.int64)
+		self.code_lens = np.zeros(1 << self.byte_size, dtype=np.uint8)
+		for char, (bits, length) in self.huffman_table.items():
+			self.code_bits[char] = bits
+			self.code_lens[char] = length
 		return self.huffman_table
 
-	def _compress_huffman_table(self):
-		# calling recursive method
-		return Huffman.encode_tree(self.huffman_tree)
-
-	def _normalize_bytes(self, encoded_bytes: [str], encode_padding: bool = False) -> [int]:
-		# join all encoded bytes as a long bit string
-		all_bytes = ''.join(encoded_bytes)
-
-		# calculate right-padding to be able to split all_bytes into 8-bit bytes
-		# we do +4 if we encode_padding to account for the 4 bits that normal_padding is going to take up in the header
-		self.normal_padding = (8 - (len(all_bytes) + (4 if encode_padding else 0)) % 8) % 8
-		all_bytes += '0' * self.normal_padding
-		if encode_padding:
-			# if we're encoding, encode split_padding and normal_padding as the [4:12] bits of the header
-			bin_normal_padding = bin(self.normal_padding)[2:].zfill(4)
-			if self.print:
-				print(f'{bin_normal_padding = }')
-			# byte_size (4bits) + split_padding (4bits) + normal_padding (4bits) + compressed huffman_table + data
-			all_bytes = all_bytes[:8] + bin_normal_padding + all_bytes[8:]
-		if self.print:
-			print(f'{all_bytes = }')
-		# return a list of bytes split every 8 bits, parsed back into integers
-		return [int(all_bytes[i:i + 8], 2) for i in range(0, len(all_bytes), 8)]
-
-	def _uncompress_huffman_tree(self, node: Node):
-		if self.source_index < self.source_length:  # if we still have data left
-			if self.source_data[self.source_index] == '0':  # if the next bit is 0 we're not in a leaf node
-				# get code of current node or ''
-				code = node.code if node.code else ''
-				# when encoding we always go left (1) then right (0)
-				node.left = Huffman.Node(None, None, code + '1')
-				node.right = Huffman.Node(None, None, code + '0')
-
-				self.source_index += 1
-				self._uncompress_huffman_tree(node.left)
-				self._uncompress_huffman_tree(node.right)
-			else:  # == '1'. else we're in a leaf node, read char.       1[#####]0001[#####]00
-				node.char = self.source_data[self.source_index + 1: self.source_index + 1 + self.byte_size]
-				self.source_index += 1 + self.byte_size
+	def _compress_huffman_table(self) -> [(int, int)]:
+		# the canonical codes only need their lengths: symbol count - 1 (byte_size bits) + length width (4 bits),
+		# then per used symbol in order: gap from the previous symbol (elias gamma) + code length (width bits)
+		chars = sorted(self.huffman_table)
+		width = max(length for _, length in self.huffman_table.values()).bit_length()
+		fields = [(len(chars) - 1, self.byte_size), (width, 4)]
+		previous = -1
+		for char in chars:
+			# gap >= 1, as elias gamma: gap.bit_length() - 1 0s, then gap itself
+			gap = char - previous
+			fields.append((gap, 2 * gap.bit_length() - 1))
+			fields.append((self.huffman_table[char][1], width))
+			previous = char
+		return fields
+
+	def _uncompress_huffman_table(self, reader: BitReader) -> {int: int}:
+		# read back the code lengths written by _compress_huffman_table, {char: length}
+		count = reader.read_bits(self.byte_size) + 1
+		width = reader.read_bits(4)
+		lengths = {}
+		char = -1
+		# the longest elias gamma gap, 2**byte_size from char -1 to the last possible symbol
+		longest = 2 * self.byte_size + 1
+		for _ in range(count):
+			# elias gamma gap: the 0s before its leading 1 in a single peek, the gap is the 1 and that many more bits
+			zeros = longest - reader.peek_bits(longest).bit_length()
+			char += reader.read_bits(2 * zeros + 1)
+			lengths[char] = reader.read_bits(width)
+		return lengths
 
 	def print_stats(self, total_time):
 		s_size = self.source.stat().st_size
 		d_size = self.destination.stat().st_size
 		table = [
-			['Source file', size(s_size)],
-			['Destination file', size(d_size)],
+			['Source file', _size(s_size)],
+			['Destination file', _size(d_size)],
 			['Decompression' if self.decode else 'Compression', f'{(d_size - s_size) / s_size * 100:+.2f}%'],
 			['Total time', f'{total_time:.2f}s']
 		]
@@ -1,40 +1,228 @@
-import argparse, heapq
+import argparse
+import mmap
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from hurry.filesize import size
+import numpy as np
 from tabulate import tabulate
 
+try:
+	from numba import njit
+except ImportError:  # numba is optional, without it the jitted functions run as plain python
+	def njit(*args, **kwargs):
+		def decorator(function):
+			# over memoryviews of the array arguments, indexing them gives python ints instead of numpy scalars
+			def wrapper(*arguments):
+				return function(*(memoryview(a) if isinstance(a, np.ndarray) else a for a in arguments))
+			return wrapper
+		return decorator
+
+
+@njit(cache=True, nogil=True)
+def _encode_stream(symbols, code_bits, code_lens, frequencies, normalize_limit, out, acc, nbits):
+	# pack the code of every symbol msb first into out, same as BitWriter.write() in a loop
+	# with a normalize_limit (0 for none) also count every symbol in frequencies, halving all of them once one reaches
+	# it, the halving depends on the order so this can't be a histogram of the whole segment
+	written = 0
+	for i in range(symbols.shape[0]):
+		symbol = int(symbols[i])
+		length = int(code_lens[symbol])
+		acc = (acc << length) | int(code_bits[symbol])
+		nbits += length
+		while nbits >= 8:
+			nbits -= 8
+			out[written] = (acc >> nbits) & 0xFF
+			written += 1
+		acc &= (1 << nbits) - 1
+
+		if normalize_limit:
+			frequencies[symbol] += 1
+			if frequencies[symbol] >= normalize_limit:
+				for j in range(frequencies.shape[0]):
+					frequencies[j] //= 2
+	# return the number of bytes written and the bits left in the accumulator
+	return written, acc, nbits
+
+
+@njit(cache=True)
+def _decode_stream(
+	data, position, end, fast_bits, fast, first_code, count, first_index, symbols, frequencies, normalize_limit, out
+):
+	# decode the bits [position, end) of data msb first into out, until either runs out, counting every symbol in
+	# frequencies for a normalize_limit like _encode_stream, returns the number of bytes written and the position
+	# decoding stopped at
+	written = 0
+	acc = 0
+	nbits = -(position & 7)  # the bits of the first byte before position get loaded, then masked off
+	index = position >> 3
+	while position < end and written < out.shape[0]:
+		# refill the accumulator to at least fast_bits bits, 0s past the end of data
+		while nbits < fast_bits:
+			acc = (acc << 8) | (int(data[index]) if index < data.shape[0] else 0)
+			index += 1
+			nbits += 8
+		acc &= (1 << nbits) - 1
+
+		# codes of up to fast_bits bits are a single fast table lookup
+		window = acc >> (nbits - fast_bits)
+		entry = int(fast[window])
+		if entry >= 0:  # entry: (symbol << 4) | length
+			symbol = entry >> 4
+			length = entry & 0xF
+			nbits -= length
+		else:  # longer code, extended a bit at a time until it's one of the (consecutive) canonical codes of its length
+			# offset: the code minus the first code of its length, which stays small however long the codes get
+			nbits -= fast_bits
+			length = fast_bits
+			offset = window - first_code
+			while offset >= count[length]:
+				if nbits == 0:
+					acc = (acc << 8) | (int(data[index]) if index < data.shape[0] else 0)
+					index += 1
+					nbits += 8
+				nbits -= 1
+				offset = ((offset - count[length]) << 1) | ((acc >> nbits) & 1)
+				length += 1
+			symbol = symbols[first_index[length] + offset]
+
+		position += length
+		out[written] = symbol
+		written += 1
+
+		if normalize_limit:
+			frequencies[symbol] += 1
+			if frequencies[symbol] >= normalize_limit:
+				for j in range(frequencies.shape[0]):
+					frequencies[j] //= 2
+	return written, position
+
+
+@njit(cache=True)
+def _build_tree(freq, left, right):
+	# huffman tree as arrays indexed by node, the leaves (freq[:n], ascending) are nodes 0..n-1 and the parents get
+	# created after them in order of freq as well, so with the leaves as a second queue the 2 smallest nodes are
+	# always at the fronts of the two, no heap needed (van leeuwen's two-queue algorithm), the root ends up last
+	leaves = (freq.shape[0] + 1) // 2
+	leaf, parent = 0, leaves  # fronts of the queues
+	for node in range(leaves, freq.shape[0]):
+		# pop the 2 smallest (by freq) nodes, leaves first on ties
+		for side in range(2):
+			if parent == node or (leaf < leaves and freq[leaf] <= freq[parent]):
+				child = leaf
+				leaf += 1
+			else:
+				child = parent
+				parent += 1
+			if side == 0:
+				left[node] = child
+			else:
+				right[node] = child
+		# a parent node with summed frequencies
+		freq[node] = freq[left[node]] + freq[right[node]]
+
+
+@njit(cache=True)
+def _tree_depths(left, right, leaves, depths):
+	# parents come after their children, so going back from the root every node's depth is set before its children's
+	depths[depths.shape[0] - 1] = 0
+	for node in range(depths.shape[0] - 1, leaves - 1, -1):
+		depths[left[node]] = depths[node] + 1
+		depths[right[node]] = depths[node] + 1
+
+
+def _size(n):
+	# file size in whole units of 1024, 1023B 1K 76K 1M, the same as hurry.filesize's size()
+	for unit in 'BKMGT':
+		if n < 1024:
+			break
+		n //= 1024
+	else:
+		unit = 'P'
+	return f'{n}{unit}'
+
 
 class HuffmanAdaptive:
 	encoded_file_extension = '.huff_a'  # chosen encoded file extension
-	chunk_size = 2 ** 12  # 4KB
+	chunk_size = 2 ** 20  # 1MB, default for -c, source bytes encoded or destination bytes decoded at a time
+	buffer_size = 2 ** 20  # 1MB, destination file buffer so chunk writes don't each go to the os
 	normalize_limit = 2 ** 8  # 256
-	type_dict = {'freeze': '00', 'reconstruct': '01', 'normalize': '10'}  # encoding for our -t variable
-
-	class Node:
-		def __init__(self, char, freq, code):
-			self.char = char
-			self.freq = freq
-			self.code = code
-			self.left = None
-			self.right = None
-
-		# For comparison of nodes
-		def __lt__(self, other):
-			# we compare nodes based on freq
-			return self.freq < other.freq
-
-		def __repr__(self):
-			# debug printing
-			return f'Node({self.char}: {self.freq}, {self.code})'
+	piece_size = 2 ** 16  # 64KB, least bytes per thread when encoding frozen codes in parallel
+	type_dict = {'freeze': 0b00, 'reconstruct': 0b01, 'normalize': 0b10}  # 2-bit encoding for our -t variable
+	type_names = {bits: name for name, bits in type_dict.items()}  # -t variable back from its 2-bit encoding
+	fast_bits = 9  # codes up to this long are decoded with a single table lookup
+
+	class BitWriter:
+		def __init__(self, file):
+			self.file = file  # full bytes get written out to it on flush()
+			self.buffer = bytearray()
+			self.staging = np.empty(0, dtype=np.uint8)  # encoded bytes of write_symbols(), reused between calls
+			self.acc = 0  # bits not yet flushed into buffer, msb first
+			self.nbits = 0
+
+		def write(self, bits, length):
+			# append length bits to the accumulator, then flush every full byte off its top
+			self.acc = (self.acc << length) | bits
+			self.nbits += length
+			while self.nbits >= 8:
+				self.nbits -= 8
+				self.buffer.append(self.acc >> self.nbits)
+				self.acc &= (1 << self.nbits) - 1
+
+		def write_symbols(self, symbols, code_bits, code_lens, frequencies, normalize_limit):
+			# write() the code of every symbol in bulk, counting them in frequencies for a normalize_limit
+			# the kernel packs into the staging array, which only gets reallocated when a segment doesn't fit
+			size = (self.nbits + int(code_lens[symbols].sum(dtype=np.int64))) // 8
+			if self.staging.size < size:
+				self.staging = np.empty(max(size, 2 * self.staging.size), dtype=np.uint8)
+			written, self.acc, self.nbits = _encode_stream(
+				symbols, code_bits, code_lens, frequencies, normalize_limit, self.staging, self.acc, self.nbits
+			)
+			self.buffer += memoryview(self.staging)[:written]
+
+		def write_symbols_parallel(self, symbols, code_bits, code_lens, executor, pieces):
+			# write_symbols() without counting, split into pieces that get encoded at the same time
+			# every piece starts at the bit offset the ones before it end at (known from the code lengths), so each
+			# can be encoded on its own, only the byte two pieces share needs merging
+			parts = np.array_split(symbols, pieces)
+			offsets = [self.nbits]
+			for part in parts:
+				offsets.append(offsets[-1] + int(code_lens[part].sum(dtype=np.int64)))
+
+			no_frequencies = np.empty(0, dtype=np.int64)  # nothing gets counted without a normalize_limit
+
+			def encode(part, start, stop):
+				# the bits before start in the first byte are left as 0s
+				out = np.empty(stop // 8 - start // 8, dtype=np.uint8)
+				return out, _encode_stream(part, code_bits, code_lens, no_frequencies, 0, out, 0, start % 8)
+
+			for out, (written, acc, nbits) in executor.map(encode, parts, offsets[:-1], offsets[1:]):
+				if written:  # our partial byte goes on top of the piece's first one
+					out[0] |= self.acc << (8 - self.nbits)
+					self.buffer += memoryview(out)[:written]
+					self.acc, self.nbits = acc, nbits
+				else:  # the piece didn't finish a byte, all its bits come after ours
+					self.acc = (self.acc << (nbits - self.nbits)) | acc
+					self.nbits = nbits
+
+		def flush(self):
+			# write the full bytes out to file, only the last partial byte stays in the accumulator
+			self.file.write(self.buffer)
+			self.buffer.clear()
+
+		def finish(self):
+			# right-pad the last partial byte with 0s, flush it, return the number of padding bits
+			padding = (8 - self.nbits) % 8
+			self.write(0, padding)
+			self.flush()
+			return padding
 
 	def __init__(self):
 		self.parser = None
 		self.args = None
 
 		self.source = None
-		self.source_f = None
+		self.source_data = None
 
 		self.destination = None
 		self.destination_f = None
@@ -42,20 +230,25 @@ class HuffmanAdaptive:
 		self.decode = None
 		self.n = None
 		self.type = None
+		self.chunk_size = None
 
 		self.normal_padding = 0
 
-		self.destination_data = None
-
 		self.huffman_tree = None
 		self.huffman_table = None
 		self.huffman_frequencies = None
-		self.read_bytes = 0  # _update_frequencies() limit compared to self.n (form of 2 ** n)
+		self.code_bits = None
+		self.code_lens = None
+		self.fast_table = None
+		self.fast_length = 0
+		self.first_code = 0
+		self.code_count = None
+		self.first_index = None
+		self.code_symbols = None
+		self.read_bytes = 0  # _update_read_bytes() limit compared to self.n (form of 2 ** n)
 
 		self.frozen = False
 
-		self.chunk_index = 0
-		self.chunk_length = 0
 		self.byte_limit = None
 
 		self.print = None
@@ -78,6 +271,8 @@ class HuffmanAdaptive:
 		                         choices=range(0, 16))
 		self.parser.add_argument('-t', help='Type of action to take', choices=['freeze', 'reconstruct', 'normalize'],
 		                         default='freeze')
+		self.parser.add_argument('-c', '--ChunkSize', help='Bytes encoded or decoded at a time', type=int,
+		                         default=HuffmanAdaptive.chunk_size)
 		self.parser.add_argument('-p', '--Print', help='Print flag', action='store_true')
 		self.parser.add_argument('-D', '--Decode', help='Decode flag', action='store_true')
 		self.args = self.parser.parse_args()
@@ -87,6 +282,7 @@ class HuffmanAdaptive:
 		self.n = self.args.n
 		self.byte_limit = 2 ** self.n
 		self.type = self.args.t
+		self.chunk_size = self.args.ChunkSize
 		self.print = self.args.Print
 		self.decode = self.args.Decode
 
@@ -98,6 +294,9 @@ class HuffmanAdaptive:
 		if self.n < 0:
 			self.parser.error(f'-n ({self.n}) must be non-negative')
 
+		if self.chunk_size < 1:
+			self.parser.error(f'-c ({self.chunk_size}) must be positive')
+
 		if self.decode:
 			if self.source.suffix != HuffmanAdaptive.encoded_file_extension:
 				self.parser.error(
@@ -127,208 +326,226 @@ class HuffmanAdaptive:
 		if self.print:
 			print(f'{self.source, self.destination = }')
 
-		self.destination_data = list()  # init
+		self.destination_f = self.destination.open('wb', buffering=HuffmanAdaptive.buffer_size)
+		self.source_data = self._read_source_bytes()
+		writer = HuffmanAdaptive.BitWriter(self.destination_f)
 		# bin_n (4 bits) + normal_padding (4 bits) + bin_type (2 bits)
 		# bin_n + normal_padding will be added after the whole file is finished being encoded
-		header = '00000000' + HuffmanAdaptive.type_dict[self.type]
-		self.destination_data.append(header)
+		writer.write(0, 8)
+		writer.write(HuffmanAdaptive.type_dict[self.type], 2)
 		if self.print:
-			print(f'{self.destination_data = }')
+			print(f'{len(writer.buffer) = }')
 
 		self.read_bytes = 0
 		self._init_frequencies()
 		self._generate_codes(self._build_huffman_tree())
 		if self.print:
-			print(f'{sorted(self.huffman_frequencies.items(), key=lambda x: x[1], reverse=True) = }', end='\n\n')
-			print(f'{sorted(self.huffman_table.items(), key=lambda x: (len(x[1]), x[1])) = }', end='\n\n')
+			print(f'{sorted(enumerate(self.huffman_frequencies.tolist()), key=lambda x: x[1], reverse=True) = }', end='\n\n')
+			print(f'{sorted(enumerate(self.huffman_table), key=lambda x: (x[1][1], x[1][0])) = }', end='\n\n')
+
+		# frozen codes don't depend on what came before, so the rest of the file can be encoded a piece per core
+		workers = os.cpu_count() or 1
+		executor = ThreadPoolExecutor(workers) if self.type == 'freeze' and workers > 1 else None
 
-		while chunk := self._read_source_chunk_bytes():
+		for chunk in self._read_source_chunks():
 			if not self.print:
 				print('.', end='', flush=True)
-			for byte in chunk:
-				self.destination_data.append(self.huffman_table[byte])
-				self._update_frequencies(byte)
+			symbols = np.frombuffer(chunk, dtype=np.uint8)
+			# encode up to every table rebuild at a time (every byte_limit bytes, none once frozen)
+			position = 0
+			while position < symbols.size:
+				stop = symbols.size if self.frozen else min(symbols.size, position + self.byte_limit - self.read_bytes)
+				segment = symbols[position:stop]
+				pieces = min(workers, segment.size // HuffmanAdaptive.piece_size)
+				if self.frozen and executor and pieces > 1:
+					writer.write_symbols_parallel(segment, self.code_bits, self.code_lens, executor, pieces)
+				elif self.type == 'normalize':
+					writer.write_symbols(
+						segment, self.code_bits, self.code_lens, self.huffman_frequencies, HuffmanAdaptive.normalize_limit
+					)
+				else:
+					writer.write_symbols(segment, self.code_bits, self.code_lens, self.huffman_frequencies, 0)
+					if not self.frozen:  # frozen codes never get rebuilt, so counting would be wasted
+						self.huffman_frequencies += np.bincount(segment, minlength=2 ** 8)
+				self._update_read_bytes(stop - position)
+				position = stop
 
 			if self.print:
 				print('=' * 256)
-				print(f'{chunk = }', end='\n\n')
-				print(f'{sorted(self.huffman_frequencies.items(), key=lambda x: x[1], reverse=True) = }', end='\n\n')
-				print(f'{sorted(self.huffman_table.items(), key=lambda x: (len(x[1]), x[1])) = }', end='\n\n')
-				print(f'{self.destination_data = }')
+				print(f'{len(chunk) = }', end='\n\n')
+				print(f'{sorted(enumerate(self.huffman_frequencies.tolist()), key=lambda x: x[1], reverse=True) = }', end='\n\n')
+				print(f'{sorted(enumerate(self.huffman_table), key=lambda x: (x[1][1], x[1][0])) = }', end='\n\n')
+				print(f'{len(writer.buffer) = }')
 				print('=' * 256, end='\n\n')
-				pass
 
-			self._write_destination_chunk()
+			writer.flush()
 
-		if self.destination_data:
-			if self.print:
-				print(f'LEFTOVER {self.destination_data = }')
-			self._write_destination_chunk(True)
+		# flush the last byte, right-padded with normal_padding 0s
+		if self.print:
+			print(f'LEFTOVER {writer.acc, writer.nbits = }')
+		self.normal_padding = writer.finish()
+		if executor:
+			executor.shutdown()
 
 		# updating the header, first byte only
-		self.destination_f.close()
-		header = bin(self.n)[2:].zfill(4) + bin(self.normal_padding)[2:].zfill(4)
+		header = (self.n << 4) | self.normal_padding
 		if self.print:
-			print(f'{header = }')
-		self.destination_f = open(self.destination, 'rb+')
-		self.destination_f.write(bytearray([int(header, 2)]))
+			print(f'{header = :08b}')
+		self.destination_f.seek(0)
+		self.destination_f.write(bytearray([header]))
+		self.destination_f.close()
 
 	def _decode(self):
 		if self.print:
 			print(f'{self.source, self.destination = }', end='\n\n')
 
-		self.destination_data = list()
-		self.header = ''
-		self.chunk_index = 0
 		self._init_frequencies()
 		self._generate_codes(self._build_huffman_tree())
 
 		if self.print:
-			print(f'{sorted(self.huffman_frequencies.items(), key=lambda x: x[1], reverse=True) = }', end='\n\n')
-			print(f'{sorted(self.huffman_table.items(), key=lambda x: x[1]) = }', end='\n\n')
+			print(f'{sorted(enumerate(self.huffman_frequencies.tolist()), key=lambda x: x[1], reverse=True) = }', end='\n\n')
+			print(f'{sorted(enumerate(self.huffman_table), key=lambda x: (x[1][1], x[1][0])) = }', end='\n\n')
+
+		self.destination_f = self.destination.open('wb', buffering=HuffmanAdaptive.buffer_size)
+		self.source_data = self._read_source_bytes()
+
+		# the header, bin_n (4 bits) + normal_padding (4 bits) + bin_type (2 bits)
+		self.n = self.source_data[0] >> 4
+		self.byte_limit = 2 ** self.n
+		self.normal_padding = self.source_data[0] & 0b1111
+		self.type = HuffmanAdaptive.type_names[self.source_data[1] >> 6]
+		if self.print:
+			print(f'{self.n = }')
+			print(f'{self.normal_padding = }')
+			print(f'{self.type = }')
+
+		# the encoded bits come right after the header, up to normal_padding (added in encoding at the end to fit
+		# 8-bit bytes) 10101010 1111[0000]
+		data = np.frombuffer(self.source_data, dtype=np.uint8)
+		position, end = 10, data.size * 8 - self.normal_padding
+		if self.print:
+			print(f'{position, end = }')
 
-		current_byte = ''
-		while chunk := self._read_source_chunk_string():
+		out = np.empty(self.chunk_size, dtype=np.uint8)
+		while position < end:
 			if not self.print:
 				print('.', end='', flush=True)
-			self.chunk_length = len(chunk)
-			self.chunk_index = 0
-			if self.header == '':  # self.header also signals first chunk
-				self.header = chunk[:10]
-				self.n = int(self.header[:4], 2)
-				self.byte_limit = 2 ** self.n
-				self.normal_padding = int(self.header[4:8], 2)
-				self.type = {v: k for k, v in HuffmanAdaptive.type_dict.items()}[self.header[8:]]
-				self.chunk_index = 10
-				if self.print:
-					print(f'{self.header = }')
-					print(f'{self.n = }')
-					print(f'{self.normal_padding = }')
-					print(f'{self.type = }')
-
-			if self.source_f.read(1) == b'':  # last chunk, need to remove self.normal_padding
-				self.chunk_length -= self.normal_padding
-				if self.print:
-					print(f'LAST CHUNK')
-			else:  # otherwise move back by 1
-				self.source_f.seek(-1, os.SEEK_CUR)  # ###############| A ###############
-				if self.print:
-					print(f'NOT LAST CHUNK')
-
-			# decoding using huffman_table
-			while self.chunk_index < self.chunk_length:  # S[10010]1010101010101, [10010]S[10101]0101010101
-				current_byte += chunk[self.chunk_index]
-				self.chunk_index += 1
-				if current_byte in self.huffman_table:
-					decoded_byte = self.huffman_table[current_byte]
-					self._update_frequencies(decoded_byte)
-					self.destination_data.append(decoded_byte)
-					current_byte = ''
+			# decode up to every table rebuild at a time (every byte_limit bytes, none once frozen)
+			written = 0
+			while written < out.size and position < end:
+				stop = out.size if self.frozen else min(out.size, written + self.byte_limit - self.read_bytes)
+				count, position = _decode_stream(
+					data, position, end, self.fast_length, self.fast_table, self.first_code, self.code_count,
+					self.first_index, self.code_symbols, self.huffman_frequencies,
+					HuffmanAdaptive.normalize_limit if self.type == 'normalize' else 0, out[written:stop]
+				)
+				if self.type != 'normalize' and not self.frozen:  # same counting as in _encode()
+					self.huffman_frequencies += np.bincount(out[written:written + count], minlength=2 ** 8)
+				self._update_read_bytes(count)
+				written += count
 
 			if self.print:
 				print('=' * 256)
-				print(f'{chunk[:self.chunk_length] = }', end='\n\n')
-				print(f'{sorted(self.huffman_frequencies.items(), key=lambda x: x[1], reverse=True) = }', end='\n\n')
-				print(f'{sorted(self.huffman_table.items(), key=lambda x: x[1]) = }', end='\n\n')
-				print(f'{self.destination_data = }')
+				print(f'{written = }', end='\n\n')
+				print(f'{sorted(enumerate(self.huffman_frequencies.tolist()), key=lambda x: x[1], reverse=True) = }', end='\n\n')
+				print(f'{sorted(enumerate(self.huffman_table), key=lambda x: (x[1][1], x[1][0])) = }', end='\n\n')
 				print('=' * 256, end='\n\n')
-				pass
-
-			self._write_destination_chunk(normalize=False)
-
-		if self.destination_data:
-			if self.print:
-				print(f'LEFTOVER {self.destination_data = }')
-			self._write_destination_chunk(True, False)
-
-	def _read_source_chunk_bytes(self):
-		if not self.source_f:
-			self.source_f = self.source.open('rb')
 
-		return self.source_f.read(HuffmanAdaptive.chunk_size)
+			self.destination_f.write(memoryview(out)[:written])
 
-	def _write_destination_chunk(self, leftover: bool = False, normalize: bool = True):
-		if not self.destination_f:
-			self.destination_f = self.destination.open('wb')
+		self.destination_f.close()
 
-		if normalize:
-			self.destination_f.write(bytearray(self._normalize_bytes(leftover)))
-		else:
-			self.destination_f.write(bytearray(self.destination_data))
-			self.destination_data = list()
-
-	def _normalize_bytes(self, leftover: bool = False) -> [int]:
-		# join all encoded bytes as a long bit string
-		all_bytes = ''.join(self.destination_data)  # with header: 0000 0000 ## $$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$$
-		all_bytes_len = len(all_bytes)
-		if self.print:
-			# print(f'{all_bytes = }')
-			pass
-
-		if not leftover:
-			leftover = len(all_bytes) % 8
-			leftover_str = all_bytes[all_bytes_len - leftover:]
-			self.destination_data = [leftover_str] if leftover_str else list()
-			# return a list of bytes split every 8 bits, parsed back into integers
-			return [int(all_bytes[i:i + 8], 2) for i in range(0, all_bytes_len - leftover, 8)]
-		else:
-			self.normal_padding = (8 - all_bytes_len % 8) % 8
-			all_bytes += '0' * self.normal_padding
-			# return a list of bytes split every 8 bits, parsed back into integers
-			return [int(all_bytes, 2)]
+	def _read_source_bytes(self) -> memoryview:
+		# map the file, pages are only read in as they're used (an empty file can't be mapped, and has no pages)
+		if not self.source.stat().st_size:
+			return memoryview(b'')
+		with open(self.source, 'rb') as f:
+			mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		# it's read front to back, so the os can read ahead further (not every platform has madvise)
+		if hasattr(mapped, 'madvise'):
+			mapped.madvise(mmap.MADV_SEQUENTIAL)
+		return memoryview(mapped)
+
+	def _read_source_chunks(self):
+		# chunk_size views of the mapped file, slicing copies nothing
+		for start in range(0, len(self.source_data), self.chunk_size):
+			yield self.source_data[start:start + self.chunk_size]
 
 	def _init_frequencies(self):
-		self.huffman_frequencies = {k: 0 for k in range(0, 2 ** 8)}
+		self.huffman_frequencies = np.zeros(2 ** 8, dtype=np.int64)
 
 	def _build_huffman_tree(self):
-		# init heap [Node(1, 2, None), Node(2, 2, None), Node(3, 1, None)]
-		heap = [HuffmanAdaptive.Node(char, freq, None) for char, freq in self.huffman_frequencies.items()]
-		# heapify based on Node.__lt__, which sorts by node.freq
-		heapq.heapify(heap)
-
-		# while we have more than 1 element
-		while len(heap) > 1:
-			# pop the 2 smallest (by freq) nodes
-			node1 = heapq.heappop(heap)
-			node2 = heapq.heappop(heap)
-
-			# create a parent node with summed frequencies
-			merged = HuffmanAdaptive.Node(None, node1.freq + node2.freq, None)
-			merged.left = node1
-			merged.right = node2
-
-			# push parent
-			heapq.heappush(heap, merged)
-
-		# heap[0] is the root of the whole tree, save and return it
-		self.huffman_tree = heap[0]
+		# leaves sorted by freq, ties in char order, a stable sort on the int array keeps them that way
+		# all 256 are kept, zero freq ones too, since any byte can still come up and has to have a code
+		order = np.argsort(self.huffman_frequencies, kind='stable')
+		freq = np.empty(2 * order.size - 1, dtype=np.int64)
+		freq[:order.size] = self.huffman_frequencies[order]
+		left = np.full(freq.size, -1, dtype=np.int32)  # child nodes, -1 for the leaves
+		right = np.full(freq.size, -1, dtype=np.int32)
+		_build_tree(freq, left, right)
+
+		# leaf i is the char order[i], save and return the tree
+		self.huffman_tree = (order, left, right)
 		return self.huffman_tree
 
-	def _generate_codes(self, node, prefix='', code_dict=None):
-		if code_dict is None:
-			code_dict = {}
-
-		if node:  # if we have a node
-			if node.char is not None:  # if we're a leaf, assign prefix as the encoding of node.char
-				if self.decode:
-					code_dict[prefix] = node.char
-				else:
-					code_dict[node.char] = prefix
-			else:  # else we travel left (1), then right (0)
-				self._generate_codes(node.left, prefix + '1', code_dict)
-				self._generate_codes(node.right, prefix + '0', code_dict)
-
-		# save huffman_table and return it
-		self.huffman_table = code_dict
+	def _generate_codes(self, tree):
+		# only the code lengths (leaf depths) come from the tree
+		order, left, right = tree
+		depths = np.empty(left.size, dtype=np.int64)
+		_tree_depths(left, right, order.size, depths)
+		lengths = np.empty(2 ** 8, dtype=np.int64)
+		lengths[order] = depths[:order.size]
+
+		# the same lengths give the same canonical codes, which most rebuilds do once the frequencies settle
+		if self.code_lens is not None and np.array_equal(lengths, self.code_lens):
+			return self.huffman_table
+
+		# canonical codes, in (length, char) order every code is the previous one + 1, shifted left whenever the
+		# length grows, so the same lengths always give the same codes however the tree's children were ordered
+		canonical = np.argsort(lengths, kind='stable')  # chars in (length, char) order
+		code_bits = [0] * 2 ** 8
+		bits, previous_length = 0, 0
+		for char, length in zip(canonical.tolist(), lengths[canonical].tolist()):
+			bits <<= length - previous_length
+			code_bits[char] = bits
+			bits += 1
+			previous_length = length
+
+		# save the code arrays (the jitted encoder indexes them by byte) and huffman_table, a (bits, length) per
+		# byte, then the tables for decoding them if that's what they're for, and return huffman_table
+		self.code_bits = np.array(code_bits, dtype=np.int64)
+		self.code_lens = lengths.astype(np.uint8)
+		self.huffman_table = list(zip(code_bits, lengths.tolist()))
+		if self.decode:
+			self._build_decode_tables(canonical)
 		return self.huffman_table
 
-	def _update_frequencies(self, byte):
-		self.huffman_frequencies[byte] += 1
-		self.read_bytes += 1
-
-		if self.type == 'normalize' and self.huffman_frequencies[byte] >= HuffmanAdaptive.normalize_limit:
-			for key in self.huffman_frequencies:
-				self.huffman_frequencies[key] //= 2
+	def _build_decode_tables(self, canonical):
+		# canonical decoding tables, indexed by code length, code_symbols: chars in the order their codes were assigned
+		lengths = self.code_lens[canonical]
+		max_length = int(lengths[-1])
+		self.code_symbols = canonical.astype(np.int64)
+		self.code_count = np.bincount(lengths, minlength=max_length + 1).astype(np.int64)  # codes with that length
+		self.first_index = np.zeros(max_length + 1, dtype=np.int64)  # index in code_symbols of the first with that length
+		self.first_index[1:] = np.cumsum(self.code_count)[:-1]
+
+		# fast table indexed by the next fast_length bits, (char << 4) | length for codes that fit, else -1
+		self.fast_length = min(HuffmanAdaptive.fast_bits, max_length)
+		self.fast_table = np.full(1 << self.fast_length, -1, dtype=np.int32)
+		# the codes that fit are the first ones in canonical order
+		for char in canonical[:self.first_index[self.fast_length] + self.code_count[self.fast_length]].tolist():
+			bits, length = self.huffman_table[char]  # every index starting with the code's bits
+			shift = self.fast_length - length
+			self.fast_table[bits << shift:(bits + 1) << shift] = (char << 4) | length
+		# longer codes start from the first fast_length bit code (or where it'd be if there's none of that length)
+		bits = 0
+		for length in range(1, self.fast_length + 1):
+			self.first_code = bits
+			bits = (bits + int(self.code_count[length])) << 1
+
+	def _update_read_bytes(self, count):
+		# count more bytes coded, the table gets rebuilt every byte_limit of them
+		self.read_bytes += count
 
 		if self.read_bytes == self.byte_limit:
 			self.read_bytes = 0
@@ -342,19 +559,12 @@ class HuffmanAdaptive:
 				case 'normalize':
 					self._generate_codes(self._build_huffman_tree())
 
-	def _read_source_chunk_string(self):
-		if not self.source_f:
-			self.source_f = self.source.open('rb')
-
-		# split all file bytes by byte, get the binary string representation, remove '0b' start, pad left with 0s
-		return ''.join(bin(byte)[2:].zfill(8) for byte in self.source_f.read(HuffmanAdaptive.chunk_size))
-
 	def print_stats(self, total_time):
 		s_size = self.source.stat().st_size
 		d_size = self.destination.stat().st_size
 		table = [
-			['Source file', size(s_size)],
-			['Destination file', size(d_size)],
+			['Source file', _size(s_size)],
+			['Destination file', _size(d_size)],
 			['Decompression' if self.decode else 'Compression', f'{(d_size - s_size) / s_size * 100:+.2f}%'],
 			['Total time', f'{total_time:.2f}s']
 		]